@@ -7,8 +7,16 @@ bash cleanup.sh
 
 pods=(bin-bash python-print root-python root-fillrandom)
 
+mkdir -p samples
+
 for pod in "${pods[@]}"; do
+    python3 sample.py "samples/${pod}-$(date -Ins).bin" &
+    sampler=$!
+    # Stop the sampler even when the run fails and `set -e` exits early.
+    trap 'kill "${sampler}" 2>/dev/null || true' EXIT
     go run main.go "manifests/${pod}.yaml" >> "results/${pod}.log"
+    kill "${sampler}" || true
+    trap - EXIT
     python3 analyse.py "results/${pod}.log" >> "results/$(hostname)-$(date -Ins)"
     bash cleanup.sh
     # bash setup.sh
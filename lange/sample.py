@@ -0,0 +1,193 @@
+import os
+import pathlib
+import re
+import socket
+import struct
+import sys
+import time
+
+# Samples are written as fixed size little-endian records after a short
+# header, one record per interval. All counters are cumulative, rates are
+# derived when reading. Counters which are unavailable are stored as -1.
+# The cgroup fields belong to the cgroup with inode `cgroup_id`, which is
+# the benchmark pod's own cgroup when `cgroup_pod` is 1 and the whole
+# kubepods group when it is 0.
+MAGIC = b"LSMP"
+VERSION = 2
+HEADER = struct.Struct("<4sHd64s")
+RECORD_FIELDS = [
+    "cpu_busy",
+    "cpu_iowait",
+    "cpu_total",
+    "memory_used",
+    "disk_read",
+    "disk_write",
+    "disk_busy_ms",
+    "net_rx",
+    "net_tx",
+    "cgroup_pod",
+    "cgroup_id",
+    "cgroup_cpu_usec",
+    "cgroup_memory",
+    "cgroup_read",
+    "cgroup_write",
+]
+RECORD = struct.Struct("<d" + "q" * len(RECORD_FIELDS))
+
+SECTOR_SIZE = 512
+VIRTUAL_INTERFACES = ("lo", "veth", "cni", "flannel", "cali", "docker", "br-")
+CGROUP_CANDIDATES = [
+    "/sys/fs/cgroup/kubepods.slice",
+    "/sys/fs/cgroup/kubepods",
+]
+# Pod cgroups are 'pod<uid>' with the cgroupfs driver and
+# 'kubepods-<qos>-pod<uid>.slice' with the systemd driver.
+POD_CGROUP_REGEX = re.compile(r"pod[0-9a-f]{8}[-_][0-9a-f]{4}[-_][0-9a-f]{4}[-_][0-9a-f]{4}[-_][0-9a-f]{12}(?:\.slice)?$")
+
+
+def readCpu():
+    with open("/proc/stat") as statFile:
+        values = [int(value) for value in statFile.readline().split()[1:9]]
+    total = sum(values)
+    idle = values[3] + values[4]
+    return total - idle, values[4], total
+
+
+def readMemory():
+    memInfo = {}
+    with open("/proc/meminfo") as memFile:
+        for line in memFile:
+            key, value = line.split(":", 1)
+            memInfo[key] = int(value.split()[0]) * 1024
+    return memInfo["MemTotal"] - memInfo.get("MemAvailable", memInfo["MemFree"])
+
+
+def readDisks():
+    # Only count whole block devices, partitions would be counted twice.
+    readBytes = writeBytes = busyMs = 0
+    with open("/proc/diskstats") as diskFile:
+        for line in diskFile:
+            fields = line.split()
+            name = fields[2]
+            if name.startswith(("loop", "ram")) or not os.path.exists(f"/sys/block/{name}"):
+                continue
+            readBytes += int(fields[5]) * SECTOR_SIZE
+            writeBytes += int(fields[9]) * SECTOR_SIZE
+            busyMs += int(fields[12])
+    return readBytes, writeBytes, busyMs
+
+
+def readNetwork():
+    # Pod traffic also shows up on the host interface, so skip virtual ones.
+    rxBytes = txBytes = 0
+    with open("/proc/net/dev") as netFile:
+        for line in netFile.readlines()[2:]:
+            name, values = line.split(":", 1)
+            if name.strip().startswith(VIRTUAL_INTERFACES):
+                continue
+            values = values.split()
+            rxBytes += int(values[0])
+            txBytes += int(values[8])
+    return rxBytes, txBytes
+
+
+def readCgroup(cgroupPath):
+    if cgroupPath is None:
+        return -1, -1, -1, -1, -1
+    try:
+        cgroupId = os.stat(cgroupPath).st_ino
+        with open(cgroupPath / "cpu.stat") as cpuFile:
+            cpuUsec = int(cpuFile.readline().split()[1])
+        with open(cgroupPath / "memory.current") as memFile:
+            memory = int(memFile.read())
+        readBytes = writeBytes = 0
+        with open(cgroupPath / "io.stat") as ioFile:
+            for line in ioFile:
+                for field in line.split()[1:]:
+                    key, value = field.split("=")
+                    if key == "rbytes":
+                        readBytes += int(value)
+                    elif key == "wbytes":
+                        writeBytes += int(value)
+    except (OSError, ValueError, IndexError):
+        return -1, -1, -1, -1, -1
+    return cgroupId, cpuUsec, memory, readBytes, writeBytes
+
+
+def findCgroup():
+    # cgroup v2 only, the pods of the node all live below the kubepods group.
+    for candidate in CGROUP_CANDIDATES:
+        path = pathlib.Path(candidate)
+        if (path / "cpu.stat").exists():
+            return path
+    return None
+
+
+def findPodCgroups(kubepodsPath):
+    return {
+        path for path in kubepodsPath.rglob("*")
+        if POD_CGROUP_REGEX.search(path.name) and (path / "cpu.stat").exists()
+    }
+
+
+def findPodCgroup(kubepodsPath, knownPods):
+    # The benchmark pod is the first pod cgroup which did not exist when the
+    # sampler started, the node runs one benchmark at a time. Until it
+    # exists the kubepods group is sampled as a whole.
+    newPods = sorted(findPodCgroups(kubepodsPath) - knownPods)
+    if not newPods:
+        return kubepodsPath
+    return newPods[0]
+
+
+def sample(cgroupPath, podCgroup):
+    return RECORD.pack(
+        time.time(),
+        *readCpu(),
+        readMemory(),
+        *readDisks(),
+        *readNetwork(),
+        int(podCgroup),
+        *readCgroup(cgroupPath),
+    )
+
+
+def readSamples(path):
+    """Yield (hostname, record tuple) for every record in a sample file."""
+    with open(path, "rb") as sampleFile:
+        magic, version, interval, hostname = HEADER.unpack(sampleFile.read(HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} sample file")
+        hostname = hostname.rstrip(b"\0").decode()
+        while True:
+            record = sampleFile.read(RECORD.size)
+            if len(record) < RECORD.size:
+                return
+            yield hostname, RECORD.unpack(record)
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Please provide output file name for samples.")
+        return
+    outputName = sys.argv[1]
+    interval = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+    cgroupPath = pathlib.Path(sys.argv[3]) if len(sys.argv) > 3 else findCgroup()
+    kubepodsPath = cgroupPath if len(sys.argv) <= 3 else None
+    knownPods = findPodCgroups(kubepodsPath) if kubepodsPath is not None else set()
+    with open(outputName, "wb") as outputFile:
+        outputFile.write(HEADER.pack(MAGIC, VERSION, interval, socket.gethostname().encode()[:64]))
+        start = time.time()
+        while True:
+            if kubepodsPath is not None and (cgroupPath == kubepodsPath or not cgroupPath.exists()):
+                cgroupPath = findPodCgroup(kubepodsPath, knownPods)
+            # A cgroup given on the command line is taken to be the pod's.
+            outputFile.write(sample(cgroupPath, cgroupPath != kubepodsPath))
+            # Records are flushed as they are taken so killing the sampler
+            # at the end of a run never loses data.
+            outputFile.flush()
+            time.sleep(interval - (time.time() - start) % interval)
+
+
+if __name__ == "__main__":
+    main()
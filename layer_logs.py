@@ -0,0 +1,491 @@
+from __future__ import annotations
+
+import csv
+import datetime
+import pathlib
+import re
+import sys
+from typing import Iterable
+from typing import Iterator
+
+import matplotlib.pyplot as plt
+import pandas as pd
+from matplotlib.patches import Patch
+from tabulate import tabulate
+
+from plot import naive_utc
+
+# journalctl -o short-iso / short-iso-precise prefix. The k3s containerd log
+# file has no prefix, so it is optional.
+JOURNAL_PREFIX_REGEX = re.compile(
+    r'^(?P<time>\d{4}-\d\d-\d\dT\S+)\s+(?P<host>\S+)\s+'
+    r'(?P<unit>[^\s\[:]+)(?:\[\d+\])?:\s*(?P<message>.*)$',
+)
+
+# containerd and the cvmfs-snapshotter both log in logfmt.
+LOGFMT_REGEX = re.compile(r'(?P<key>[\w.-]+)=(?:"(?P<quoted>(?:[^"\\]|\\.)*)"|(?P<bare>\S*))')
+
+TIMESTAMP_REGEX = re.compile(
+    r'(?P<seconds>\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d)'
+    r'(?:[.,](?P<fraction>\d+))?'
+    r'(?P<offset>Z|[+-]\d\d:?\d\d)?',
+)
+
+DIGEST_REGEX = re.compile(r'sha256:[0-9a-f]{64}')
+
+# Fields which may hold the digest of the layer a message is about, in the
+# order they are checked.
+DIGEST_FIELDS = [
+    'digest',
+    'layer',
+    'layerdigest',
+    'expected',
+    'ref',
+]
+
+PULL_START_REGEX = re.compile(r'^PullImage "(?P<image>[^"]+)"$')
+PULL_END_REGEX = re.compile(r'^PullImage "(?P<image>[^"]+)" returns image reference')
+SANDBOX_REGEX = re.compile(r'^RunPodSandbox for &PodSandboxMetadata\{Name:(?P<pod>[^,]+),')
+
+# (phase, edge, message regex) for per-layer events. An 'end' event which
+# carries a `duration` field also defines the start of its phase.
+LAYER_RULES = [
+    ('fetch', 'start', re.compile(r'^fetch$')),
+    ('fetch', 'start', re.compile(r'^\(\*service\)\.Write started$')),
+    ('fetch', 'end', re.compile(r'^(?:fetch complete|commit|layer fetched)')),
+    ('unpack', 'start', re.compile(r'^(?:apply layer|extraction snapshot)')),
+    ('unpack', 'end', re.compile(r'^(?:layer applied|layer unpacked|applied diff)')),
+    ('mount', 'start', re.compile(r'(?i)^(?:prepar(?:e|ing) (?:remote )?snapshot|mount(?:ing)? layer)')),
+    ('mount', 'end', re.compile(r'(?i)^(?:remote snapshot|layer mounted|mounted layer)')),
+    # Only the snapshotter's own messages, containerd's 'already exists' is
+    # a local content store hit and not a lazy CVMFS layer.
+    ('skip', 'end', re.compile(r'(?i)(?:found in cvmfs|skip(?:ping)? fetch)')),
+]
+
+PHASES = [
+    'fetch',
+    'unpack',
+    'mount',
+]
+
+LAYER_COLUMNS = [
+    'node',
+    'pod',
+    'image',
+    'pull_start',
+    'pull_end',
+    'layer',
+    'fetch_start',
+    'fetch_end',
+    'unpack_start',
+    'unpack_end',
+    'mount_start',
+    'mount_end',
+    'skipped',
+]
+
+PHASE_COLORS = {
+    'fetch': '#546E7A',
+    'unpack': '#90A4AE',
+    'mount': '#CFD8DC',
+}
+
+# Pulls which never log an end are dropped once the stream is this far past
+# their start, which keeps memory bounded on long journal exports.
+MAX_PULL_DURATION = datetime.timedelta(hours=1)
+
+
+def parse_timestamp(string: str) -> datetime.datetime | None:
+    """Parse an ISO timestamp into a naive UTC datetime, truncating to microseconds."""
+    match = TIMESTAMP_REGEX.match(string)
+    if match is None:
+        return None
+    timestamp = datetime.datetime.strptime(match['seconds'], '%Y-%m-%dT%H:%M:%S')
+    if match['fraction']:
+        timestamp += datetime.timedelta(
+            microseconds=int(match['fraction'][:6].ljust(6, '0')),
+        )
+    offset = match['offset']
+    if offset and offset != 'Z':
+        sign = -1 if offset[0] == '-' else 1
+        offset = offset[1:].replace(':', '')
+        timestamp -= sign * datetime.timedelta(
+            hours=int(offset[:2]),
+            minutes=int(offset[2:]),
+        )
+    return timestamp
+
+
+def parse_duration(string: str) -> datetime.timedelta | None:
+    """Parse a Go duration string such as '1m2.5s' or '350.2ms'."""
+    units = {
+        'h': 3600,
+        'm': 60,
+        's': 1,
+        'ms': 1e-3,
+        'us': 1e-6,
+        'µs': 1e-6,
+        'ns': 1e-9,
+    }
+    parts = re.findall(r'([0-9.]+)(h|ms|m|s|us|µs|ns)', string)
+    if not parts:
+        return None
+    return datetime.timedelta(
+        seconds=sum(float(value) * units[unit] for value, unit in parts),
+    )
+
+
+def normalise_image(image: str) -> str:
+    for prefix in ('docker.io/library/', 'docker.io/'):
+        if image.startswith(prefix):
+            return image[len(prefix):]
+    return image
+
+
+def parse_line(line: str, default_host: str = '') -> dict | None:
+    """
+    Split one log line into its timestamp, host, unit, message and logfmt fields.
+
+    Returns None for lines without a usable timestamp.
+    """
+    host = default_host
+    unit = ''
+    body = line
+    prefix_time = None
+    match = JOURNAL_PREFIX_REGEX.match(line)
+    if match is not None:
+        host = match['host']
+        unit = match['unit']
+        body = match['message']
+        prefix_time = match['time']
+
+    fields = {}
+    for field in LOGFMT_REGEX.finditer(body):
+        value = field['quoted']
+        if value is None:
+            value = field['bare']
+        else:
+            value = value.replace('\\"', '"')
+        fields[field['key']] = value
+
+    # Prefer containerd's own nanosecond timestamp over the journal's.
+    timestamp = parse_timestamp(fields.get('time') or prefix_time or '')
+    if timestamp is None:
+        return None
+
+    return {
+        'time': timestamp,
+        'host': host,
+        'unit': unit,
+        'message': fields.get('msg', body),
+        'fields': fields,
+    }
+
+
+def find_digest(event: dict) -> str | None:
+    for key in DIGEST_FIELDS:
+        match = DIGEST_REGEX.search(event['fields'].get(key, ''))
+        if match is not None:
+            return match.group()
+    match = DIGEST_REGEX.search(event['message'])
+    return match.group() if match is not None else None
+
+
+def new_layer(digest: str) -> dict:
+    layer = {'layer': digest, 'skipped': False}
+    for phase in PHASES:
+        layer[f'{phase}_start'] = None
+        layer[f'{phase}_end'] = None
+    return layer
+
+
+def finish_pull(pull: dict) -> Iterator[dict]:
+    for layer in pull['layers'].values():
+        # containerd only logs the start of a fetch, unpacking follows it.
+        if layer['fetch_end'] is None and layer['fetch_start'] is not None:
+            layer['fetch_end'] = layer['unpack_start']
+        # A layer the snapshotter mounted without containerd ever fetching it
+        # was served lazily.
+        if layer['fetch_start'] is None and layer['mount_start'] is not None:
+            layer['skipped'] = True
+        yield {
+            'node': pull['host'],
+            'pod': pull['pod'],
+            'image': pull['image'],
+            'pull_start': pull['pull_start'],
+            'pull_end': pull['pull_end'],
+            **layer,
+        }
+
+
+def apply_layer_event(pull: dict, event: dict) -> None:
+    for phase, edge, regex in LAYER_RULES:
+        if regex.search(event['message']) is None:
+            continue
+        digest = find_digest(event)
+        if digest is None:
+            return
+        layer = pull['layers'].setdefault(digest, new_layer(digest))
+        if phase == 'skip':
+            layer['skipped'] = True
+            return
+        if edge == 'start':
+            # Keep the first start, retries are part of the same phase.
+            if layer[f'{phase}_start'] is None:
+                layer[f'{phase}_start'] = event['time']
+            return
+        layer[f'{phase}_end'] = event['time']
+        duration = parse_duration(event['fields'].get('duration', ''))
+        if duration is not None and layer[f'{phase}_start'] is None:
+            layer[f'{phase}_start'] = event['time'] - duration
+        return
+
+
+def parse_layer_events(
+        lines: Iterable[str],
+        default_host: str = '',
+) -> Iterator[dict]:
+    """
+    Reconstruct per-layer fetch, unpack and mount timings from log lines.
+
+    Lines are consumed one at a time and only the pulls which are still in
+    progress are held in memory, so arbitrarily large journal exports can be
+    streamed through. One record is yielded per layer per completed pull.
+    """
+    # host -> most recently sandboxed pod
+    pods = {}
+    # (host, image) -> pull in progress
+    pulls = {}
+    for line in lines:
+        event = parse_line(line.rstrip('\n'), default_host)
+        if event is None:
+            continue
+        host = event['host']
+        message = event['message']
+
+        match = SANDBOX_REGEX.match(message)
+        if match is not None:
+            pods[host] = match['pod']
+            continue
+
+        match = PULL_END_REGEX.match(message)
+        if match is not None:
+            pull = pulls.pop((host, normalise_image(match['image'])), None)
+            if pull is not None:
+                pull['pull_end'] = event['time']
+                yield from finish_pull(pull)
+            continue
+
+        match = PULL_START_REGEX.match(message)
+        if match is not None:
+            image = normalise_image(match['image'])
+            pulls[(host, image)] = {
+                'host': host,
+                'pod': pods.get(host, ''),
+                'image': image,
+                'pull_start': event['time'],
+                'pull_end': None,
+                'layers': {},
+            }
+            continue
+
+        open_pulls = [pull for key, pull in pulls.items() if key[0] == host]
+        if not open_pulls:
+            continue
+        # Layer messages do not name the image, attribute them to the most
+        # recent pull on the node.
+        apply_layer_event(
+            max(open_pulls, key=lambda pull: pull['pull_start']),
+            event,
+        )
+
+        for key in [
+            key for key, pull in pulls.items()
+            if event['time'] - pull['pull_start'] > MAX_PULL_DURATION
+        ]:
+            del pulls[key]
+
+
+def read_journal(path: pathlib.Path | str) -> Iterator[str]:
+    with open(path, errors='replace') as file:
+        yield from file
+
+
+def write_layer_table(
+        journal_paths: Iterable[pathlib.Path | str],
+        output_path: pathlib.Path | str,
+) -> pathlib.Path:
+    """Stream the layer records of every journal straight to a CSV file."""
+    output_path = pathlib.Path(output_path)
+    with open(output_path, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=LAYER_COLUMNS)
+        writer.writeheader()
+        for journal_path in journal_paths:
+            for record in parse_layer_events(read_journal(journal_path)):
+                writer.writerow(record)
+    return output_path
+
+
+def read_layer_table(path: pathlib.Path | str) -> pd.DataFrame:
+    time_columns = ['pull_start', 'pull_end'] + [
+        f'{phase}_{edge}' for phase in PHASES for edge in ('start', 'end')
+    ]
+    layer_df = pd.read_csv(
+        path,
+        dtype={
+            'node': 'category',
+            'pod': 'string',
+            'image': 'category',
+            'layer': 'category',
+            'skipped': 'bool',
+        },
+    )
+    # Converted explicitly so a header-only table still gets datetime columns.
+    for column in time_columns:
+        layer_df[column] = pd.to_datetime(layer_df[column], format='ISO8601')
+    for phase in PHASES:
+        layer_df[f'{phase}_time'] = (
+            layer_df[f'{phase}_end'] - layer_df[f'{phase}_start']
+        ).dt.total_seconds().astype('float32')
+    return layer_df
+
+
+def join_runs(
+        layer_df: pd.DataFrame,
+        run_df: pd.DataFrame,
+        window: datetime.timedelta = datetime.timedelta(seconds=30),
+) -> pd.DataFrame:
+    """
+    Attach the run each layer record belongs to.
+
+    Each pull is matched to the run of the same image, on the same node
+    where the run table has one, with the closest `pull_start` within
+    `window`. Result files do not record the pod, so the pod taken from
+    RunPodSandbox is only kept in the layer table and not used to match.
+    Both sides are compared in naive UTC.
+
+    >>> layers = pd.DataFrame({
+    ...     'node': ['chep'],
+    ...     'image': ['root'],
+    ...     'pull_start': pd.to_datetime(['2024-10-16T12:00:05']),
+    ... })
+    >>> runs = pd.DataFrame({
+    ...     'node': ['chep-2', 'chep'],
+    ...     'image': ['root', 'root'],
+    ...     'snapshotter': ['cvmfs', 'overlayfs'],
+    ...     'pull_start': pd.to_datetime(['2024-10-16T12:00:04', '2024-10-16T12:00:00']),
+    ... })
+    >>> join_runs(layers, runs)[['node', 'run', 'snapshotter']]
+       node  run snapshotter
+    0  chep    1   overlayfs
+    """
+    by = ['image', 'node'] if 'node' in run_df else ['image']
+    run_df = run_df.reset_index(names='run')
+    columns = [
+        column for column in ('run', 'script', 'snapshotter', 'pull_start')
+        if column in run_df
+    ]
+    runs = run_df[columns + by].rename(columns={'pull_start': 'run_pull_start'})
+    runs['image'] = runs['image'].astype(str).map(normalise_image)
+    runs['run_pull_start'] = naive_utc(runs['run_pull_start'])
+    layers = layer_df.assign(
+        image=layer_df['image'].astype(str).map(normalise_image),
+        pull_start=naive_utc(layer_df['pull_start']),
+    )
+    if 'node' in by:
+        runs['node'] = runs['node'].astype(str)
+        layers['node'] = layers['node'].astype(str)
+    joined = pd.merge_asof(
+        layers.dropna(subset=['pull_start']).sort_values('pull_start'),
+        runs.dropna(subset=['run_pull_start']).sort_values('run_pull_start'),
+        left_on='pull_start',
+        right_on='run_pull_start',
+        by=by,
+        tolerance=window,
+        direction='nearest',
+    )
+    unmatched = joined['run'].isna().sum()
+    if unmatched:
+        print(f'Warning: {unmatched} of {len(joined)} layer records matched no run')
+    return joined
+
+
+def layer_breakdown(layer_df: pd.DataFrame) -> pd.DataFrame:
+    group_columns = [
+        column for column in ('image', 'snapshotter', 'layer')
+        if column in layer_df
+    ]
+    # Layers which matched no run are kept, with an empty snapshotter.
+    breakdown = layer_df.groupby(group_columns, observed=True, dropna=False).agg(
+        pulls=('pull_start', 'count'),
+        fetch_time=('fetch_time', 'mean'),
+        unpack_time=('unpack_time', 'mean'),
+        mount_time=('mount_time', 'mean'),
+        skipped_fraction=('skipped', 'mean'),
+    )
+    breakdown['total_time'] = breakdown[
+        ['fetch_time', 'unpack_time', 'mount_time']
+    ].sum(axis=1)
+    return breakdown.reset_index().sort_values(
+        group_columns[:-1] + ['total_time'],
+        ascending=[True] * (len(group_columns) - 1) + [False],
+    )
+
+
+def plot_layer_breakdown(
+        breakdown: pd.DataFrame,
+        plot_dir: pathlib.Path,
+) -> list[pathlib.Path]:
+    plot_paths = []
+    for image, image_df in breakdown.groupby('image', observed=True):
+        fig, ax = plt.subplots(figsize=(10, max(3, 0.3 * len(image_df))))
+        labels = [
+            f'{row.layer[7:19]} ({row.snapshotter if pd.notna(row.snapshotter) else "no run"})'
+            if 'snapshotter' in image_df
+            else row.layer[7:19]
+            for row in image_df.itertuples()
+        ]
+        positions = list(range(len(image_df)))
+        left = [0.0] * len(image_df)
+        for phase in PHASES:
+            times = image_df[f'{phase}_time'].fillna(0).tolist()
+            ax.barh(
+                positions,
+                times,
+                left=left,
+                color=PHASE_COLORS[phase],
+            )
+            left = [a + b for a, b in zip(left, times)]
+        for position, skipped in zip(positions, image_df['skipped_fraction']):
+            if skipped > 0.5:
+                ax.barh(position, left[position], fill=False, hatch='x', linewidth=0)
+        ax.set_yticks(positions, labels)
+        ax.invert_yaxis()
+        ax.set_xlabel('Time [s]')
+        ax.legend(
+            handles=[
+                Patch(facecolor=PHASE_COLORS[phase], label=phase)
+                for phase in PHASES
+            ] + [Patch(fill=False, hatch='x', label='fetch skipped')],
+            loc='lower right',
+        )
+        image_name = str(image).split('/')[-1]
+        fig.suptitle(f'{image_name}\nper-layer pull time')
+        fig.tight_layout()
+        plot_path = plot_dir / f'{image_name}-layers.png'
+        fig.savefig(plot_path)
+        plt.close(fig)
+        plot_paths.append(plot_path)
+    return plot_paths
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('Please provide containerd/cvmfs-snapshotter journal exports for analysis.')
+        sys.exit(1)
+
+    table_path = write_layer_table(sys.argv[1:], 'layers.csv')
+    breakdown = layer_breakdown(read_layer_table(table_path))
+    print(tabulate(breakdown, headers='keys', showindex=False))
+    for plot_path in plot_layer_breakdown(breakdown, pathlib.Path('.')):
+        print(f'Saved plot: {plot_path.name}')
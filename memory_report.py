@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import datetime
+import random
+import sys
+import tracemalloc
+
+import pandas as pd
+from tabulate import tabulate
+
+from plot import build_run_table
+from plot import combine_run_tables
+from plot import memory_usage
+
+IMAGES = [
+    'rootproject/root:6.32.02-ubuntu24.04',
+    'rootproject/root:6.32.02-ubuntu24.04-estargz',
+    'rootproject/root:6.32.02-ubuntu24.04-soci',
+]
+
+SCRIPTS = [
+    'scripts/bin-bash.sh',
+    'scripts/python-print.sh',
+    'scripts/root-python.sh',
+    'scripts/root-fillrandom.sh',
+]
+
+SNAPSHOTTERS = [
+    'overlayfs',
+    'cvmfs-snapshotter',
+    'stargz',
+    'soci',
+]
+
+# Runs written to one result file by a benchmark campaign.
+RUNS_PER_FILE = 10_000
+
+NODES = [
+    'chep',
+    'chep-2',
+]
+
+
+def format_timestamp(timestamp: datetime.datetime) -> str:
+    # Matches `date -Ins`, which is what the result files contain.
+    return timestamp.strftime('%Y-%m-%dT%H:%M:%S,%f') + '000+00:00'
+
+
+def synthetic_benchmarks(runs: int, seed: int = 0) -> list[dict]:
+    rng = random.Random(seed)
+    start = datetime.datetime(2024, 10, 16)
+    benchmarks = []
+    for _ in range(runs):
+        times = [start]
+        for upper in (0.1, 60, 0.1, 5, 30, 0.1, 0.1):
+            times.append(times[-1] + datetime.timedelta(seconds=rng.uniform(0, upper)))
+        start = times[-1]
+        (
+            benchmark_start,
+            pull_start,
+            pull_end,
+            run_start,
+            container_start,
+            container_end,
+            _,
+            benchmark_end,
+        ) = times
+        benchmarks.append(
+            {
+                'image': rng.choice(IMAGES),
+                'script': rng.choice(SCRIPTS),
+                'snapshotter': rng.choice(SNAPSHOTTERS),
+                'node': rng.choice(NODES),
+                'benchmark_start': format_timestamp(benchmark_start),
+                'pull_start': format_timestamp(pull_start),
+                'pull_end': format_timestamp(pull_end),
+                'run_start': format_timestamp(run_start),
+                'container_start': format_timestamp(container_start),
+                'container_end': format_timestamp(container_end),
+                'benchmark_end': format_timestamp(benchmark_end),
+                'bytes': str(rng.randrange(1_000_000, 2_000_000_000)),
+            },
+        )
+    return benchmarks
+
+
+def peak_memory(function, *args):
+    """Run `function` and return its result and peak traced memory in MB."""
+    tracemalloc.start()
+    result = function(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, peak / 1_000_000
+
+
+def build_at_once(runs: int) -> pd.DataFrame:
+    # What plot.py used to do: every run of every file as object strings.
+    return pd.DataFrame(synthetic_benchmarks(runs))
+
+
+def build_per_file(runs: int) -> pd.DataFrame:
+    return combine_run_tables([
+        build_run_table(synthetic_benchmarks(min(RUNS_PER_FILE, runs - start), seed=start))
+        for start in range(0, runs, RUNS_PER_FILE)
+    ])
+
+
+if __name__ == '__main__':
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+
+    print(f'Building {runs} synthetic runs, {RUNS_PER_FILE} per result file')
+    before, before_peak = peak_memory(build_at_once, runs)
+    after, after_peak = peak_memory(build_per_file, runs)
+
+    print(
+        tabulate(
+            {
+                'column': list(after.columns),
+                'dtype': [str(after[column].dtype) for column in after.columns],
+                'before [MB]': [
+                    before[column].memory_usage(deep=True, index=False) / 1_000_000
+                    if column in before
+                    else None
+                    for column in after.columns
+                ],
+                'after [MB]': [
+                    after[column].memory_usage(deep=True, index=False) / 1_000_000
+                    for column in after.columns
+                ],
+            },
+            headers='keys',
+        ),
+    )
+    print(
+        f'\nTotal before: {memory_usage(before) / 1_000_000:.1f} MB'
+        f' (peak while building: {before_peak:.1f} MB)'
+        f'\nTotal after: {memory_usage(after) / 1_000_000:.1f} MB'
+        f' (peak while building: {after_peak:.1f} MB)',
+    )
@@ -6,12 +6,13 @@ import math
 import pathlib
 import re
 import shutil
+import sys
 from copy import copy
-from copy import deepcopy
 
 import matplotlib.pyplot as plt
 import pandas as pd
 from matplotlib.patches import Patch
+from pandas.api.types import union_categoricals
 from ruamel.yaml import YAML
 from tabulate import tabulate
 
@@ -65,29 +66,16 @@ SCRIPTS = {
 LEGEND_COLOR = '#ECEFF1'
 
 
-def is_date(string):
-    return re.search('[0-9]{4}-[0-9]{2}-[0-9]{2}T.*', string)
-
-
-def format_difference(
-        left: str,
-        right: str,
-):
-    assert is_date(left)
-    assert is_date(right)
-    left = string_to_datetime(left)
-    right = string_to_datetime(right)
-
-    time_difference = (left - right).total_seconds()
-    return time_difference
-    # return f'{left} - {right} = {time_difference} s'
+DATETIME_REGEX = re.compile('[0-9]{4}-[0-9]{2}-[0-9]{2}T.*')
 
 
 def string_to_datetime(string) -> datetime.datetime:
+    # `date -Ins` gives nanoseconds and a UTC offset, keep microseconds and
+    # convert to naive UTC like every other log source.
     return datetime.datetime.strptime(
-        string[:-9],
-        '%Y-%m-%dT%H:%M:%S,%f',
-    )
+        string[:-9] + string[-6:],
+        '%Y-%m-%dT%H:%M:%S,%f%z',
+    ).astimezone(datetime.timezone.utc).replace(tzinfo=None)
 
 
 def parse_results(result_file: pathlib.Path | str) -> list[dict]:
@@ -95,7 +83,7 @@ def parse_results(result_file: pathlib.Path | str) -> list[dict]:
         result_file = pathlib.Path(result_file)
     benchmarks = []
     benchmark = {}
-    with open(path) as file:
+    with open(result_file) as file:
         for line in file.readlines():
             line = line.strip()
 
@@ -122,37 +110,129 @@ def parse_results(result_file: pathlib.Path | str) -> list[dict]:
     return benchmarks
 
 
-def append_benchmarks(benchmark: dict):
-    benchmark = deepcopy(benchmark)
-    pull_time = format_difference(
-        benchmark['pull_end'],
-        benchmark['pull_start'],
+# Columns holding a handful of distinct labels repeated for every run.
+LABEL_COLUMNS = [
+    'image',
+    'script',
+    'snapshotter',
+    'node',
+]
+
+TIMESTAMP_COLUMNS = [
+    'pull_start',
+    'pull_end',
+    'run_start',
+    'container_start',
+    'container_end',
+    'benchmark_start',
+    'benchmark_end',
+]
+
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S,%f%z'
+
+
+def parse_timestamps(column: pd.Series) -> pd.Series:
+    # Same as `string_to_datetime`, applied to the whole column.
+    return pd.to_datetime(
+        column.str[:-9] + column.str[-6:],
+        format=TIMESTAMP_FORMAT,
+        utc=True,
+    ).dt.tz_localize(None)
+
+
+def naive_utc(column: pd.Series) -> pd.Series:
+    # Timezone aware columns are converted, naive ones are taken to be UTC.
+    if column.dt.tz is not None:
+        column = column.dt.tz_convert('UTC').dt.tz_localize(None)
+    return column.astype('datetime64[ns]')
+
+
+def seconds_between(left: pd.Series, right: pd.Series) -> pd.Series:
+    return (left - right).dt.total_seconds().astype('float32')
+
+
+def result_node(result_file: pathlib.Path) -> str:
+    # Result files are named '$(hostname)-$(date -Ins)'.
+    return DATETIME_REGEX.sub('', result_file.name).rstrip('-')
+
+
+def append_benchmarks(run_table: pd.DataFrame) -> pd.DataFrame:
+    pull_time = seconds_between(
+        run_table['pull_end'],
+        run_table['pull_start'],
     )
 
-    creation_time = format_difference(
-        benchmark['container_start'],
-        benchmark['run_start'],
+    creation_time = seconds_between(
+        run_table['container_start'],
+        run_table['run_start'],
     )
 
-    execution_time = format_difference(
-        benchmark['container_end'],
-        benchmark['container_start'],
+    execution_time = seconds_between(
+        run_table['container_end'],
+        run_table['container_start'],
     )
 
-    total_time = format_difference(
-        benchmark['benchmark_end'],
-        benchmark['benchmark_start'],
+    total_time = seconds_between(
+        run_table['benchmark_end'],
+        run_table['benchmark_start'],
     )
 
-    benchmark['pull_time'] = pull_time
-    benchmark['creation_time'] = creation_time
-    benchmark['execution_time'] = execution_time
-    benchmark['total_time'] = total_time
-    benchmark['missing_time'] = (
+    run_table['pull_time'] = pull_time
+    run_table['creation_time'] = creation_time
+    run_table['execution_time'] = execution_time
+    run_table['total_time'] = total_time
+    run_table['missing_time'] = (
         total_time - (pull_time + creation_time + execution_time)
     )
 
-    return benchmark
+    return run_table
+
+
+def build_run_table(benchmarks: list[dict]) -> pd.DataFrame:
+    """
+    Build the run table with compact column types.
+
+    Every field is parsed exactly once here so that the per-image loop only
+    ever works on categorical, datetime64, float32 and int64 columns.
+    """
+    run_table = pd.DataFrame(benchmarks)
+
+    for column in LABEL_COLUMNS:
+        if column in run_table:
+            run_table[column] = run_table[column].astype('category')
+
+    for column in TIMESTAMP_COLUMNS:
+        run_table[column] = parse_timestamps(run_table[column])
+
+    run_table['bytes'] = pd.to_numeric(run_table['bytes']).astype('int64')
+
+    return append_benchmarks(run_table)
+
+
+def combine_run_tables(run_tables: list[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Concatenate run tables built by `build_run_table`.
+
+    Label columns are merged with `union_categoricals`, so they never go
+    through an intermediate object column.
+    """
+    label_columns = [
+        column for column in LABEL_COLUMNS
+        if all(column in run_table for run_table in run_tables)
+    ]
+    run_table = pd.concat(
+        [run_table.drop(columns=label_columns) for run_table in run_tables],
+        ignore_index=True,
+    )
+    for column in label_columns:
+        run_table[column] = union_categoricals(
+            [table[column] for table in run_tables],
+        )
+    return run_table
+
+
+def memory_usage(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(deep=True).sum())
 
 
 def remove_snapshotter_name(image: str) -> str:
@@ -186,6 +266,17 @@ def format_benchmark(benchmark: dict):
 
 
 if __name__ == '__main__':
+    # Imported here, these modules use the timestamp helpers above.
+    from layer_logs import join_runs
+    from layer_logs import layer_breakdown
+    from layer_logs import plot_layer_breakdown
+    from layer_logs import read_layer_table
+    from layer_logs import write_layer_table
+    from resources import plot_pull_throughput
+    from resources import pull_samples
+    from resources import pull_throughput
+    from resources import read_samples
+
     CONFIG = load_yaml(paths.CONFIG_FILE)
     for key, value in CONFIG['regex-filters'].items():
         if value is None:
@@ -226,16 +317,40 @@ if __name__ == '__main__':
 
     result_paths = result_paths[:CONFIG['latest']]
 
-    benchmarks = []
+    # Convert one result file at a time so the raw strings of only one
+    # file are alive at once.
+    run_tables = []
     for path in result_paths:
         print(f'Processing: {path.name}')
-        benchmarks += parse_results(path)
-
-    benchmarks = [append_benchmarks(benchmark) for benchmark in benchmarks]
-
-    output_df = pd.DataFrame(benchmarks)
+        node = result_node(path)
+        benchmarks = [
+            {**benchmark, 'node': node}
+            for benchmark in parse_results(path)
+        ]
+        if not benchmarks:
+            print(f'Skipping: {path.name} has no complete benchmarks')
+            continue
+        run_tables.append(build_run_table(benchmarks))
+    if not run_tables:
+        print('No complete benchmarks in the selected result files.')
+        sys.exit(1)
+
+    output_df = combine_run_tables(run_tables)
+    del run_tables
+    print(f'Run table: {len(output_df)} runs, {memory_usage(output_df)} bytes')
+
+    # Resource samples recorded by lange/sample.py alongside the runs.
+    matched_samples = None
+    if CONFIG.get('samples_directory') is not None:
+        samples = read_samples(
+            sorted((paths.PROJECT_ROOT / CONFIG['samples_directory']).glob('*.bin')),
+        )
+        if not samples.empty:
+            matched_samples = pull_samples(samples, output_df)
+            output_df = output_df.join(pull_throughput(matched_samples))
 
-    images = output_df['image'].map(remove_snapshotter_name).unique()
+    image_names = output_df['image'].cat.categories
+    images = image_names.map(remove_snapshotter_name).unique()
 
     output_dict = {
         'image': [],
@@ -254,10 +369,14 @@ if __name__ == '__main__':
         'bytes': [],
         'bytes_std': [],
         'bytes_std_%': [],
+        'pull_throughput': [],
+        'pull_io_bound_%': [],
     }
     for image in images:
         filtered_df_1 = output_df[
-            [image in i for i in output_df['image']]
+            output_df['image'].isin(
+                image_names[image_names.str.contains(image, regex=False)],
+            )
         ]
 
         fig_time, axs_time = plt.subplots(
@@ -326,8 +445,8 @@ if __name__ == '__main__':
                 execution_time_std = filtered_df_3['execution_time'].std()
                 execution_time_std_proportion = execution_time_std / execution_time
 
-                bytes = filtered_df_3['bytes'].astype(int).mean()
-                bytes_std = filtered_df_3['bytes'].astype(int).std()
+                bytes = filtered_df_3['bytes'].mean()
+                bytes_std = filtered_df_3['bytes'].std()
                 bytes_std_proportion = bytes_std / bytes
 
                 output_dict['image'].append(image)
@@ -359,6 +478,17 @@ if __name__ == '__main__':
                     100 * bytes_std_proportion,
                 )
 
+                if 'pull_net_rx' in filtered_df_3:
+                    output_dict['pull_throughput'].append(
+                        filtered_df_3['pull_net_rx'].mean(),
+                    )
+                    output_dict['pull_io_bound_%'].append(
+                        100 * filtered_df_3['pull_io_bound'].mean(),
+                    )
+                else:
+                    output_dict['pull_throughput'].append(math.nan)
+                    output_dict['pull_io_bound_%'].append(math.nan)
+
                 if script_name in scripts_in_image:
                     bar_index = scripts_in_image.index(script_name)
 
@@ -536,8 +666,36 @@ if __name__ == '__main__':
             f'Saved plot: {plot_path.name}',
         )
         # fig_multibar.show()
+
+        if matched_samples is not None:
+            plot_path = plot_pull_throughput(
+                matched_samples,
+                output_df,
+                image,
+                paths.PLOT_DIR,
+            )
+            print(
+                f'Saved plot: {plot_path.name}',
+            )
         # -- END FOR IMAGE --
 
+    # containerd/cvmfs-snapshotter journal exports covering the same runs.
+    journal_paths = [
+        paths.PROJECT_ROOT / journal
+        for journal in CONFIG.get('journal_files') or []
+    ]
+    if journal_paths:
+        layer_table_path = write_layer_table(
+            journal_paths,
+            paths.OUTPUT_DIR / 'layers.csv',
+        )
+        layer_df = join_runs(read_layer_table(layer_table_path), output_df)
+        layer_df.to_csv(layer_table_path, index=False)
+        breakdown = layer_breakdown(layer_df)
+        breakdown.to_csv(paths.OUTPUT_DIR / 'layer_breakdown.csv', index=False)
+        for plot_path in plot_layer_breakdown(breakdown, paths.PLOT_DIR):
+            print(f'Saved plot: {plot_path.name}')
+
     output_df = pd.DataFrame(output_dict)
     output_file = paths.OUTPUT_DIR / 'output.csv'
     output_df.to_csv(
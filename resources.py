@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+import pathlib
+from typing import Iterable
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+from lange.sample import RECORD_FIELDS
+from lange.sample import readSamples
+from plot import naive_utc
+
+# A sample is I/O bound when the CPUs spend this share of their time waiting
+# on I/O, or the disks are busy for this share of the interval.
+IOWAIT_THRESHOLD = 0.2
+DISK_BUSY_THRESHOLD = 0.8
+
+
+def read_samples(sample_paths: Iterable[pathlib.Path | str]) -> pd.DataFrame:
+    """
+    Read `lange/sample.py` files into per-interval rates.
+
+    Byte rates are in MB/s, CPU and disk figures are fractions of the
+    interval and memory is in MB. The `cgroup_*` columns are NaN for
+    samples which were not taken from the benchmark pod's own cgroup.
+    """
+    frames = []
+    for path in sample_paths:
+        records = list(readSamples(path))
+        if len(records) < 2:
+            continue
+        counters = pd.DataFrame(
+            [record for _, record in records],
+            columns=['time'] + RECORD_FIELDS,
+        ).replace(-1, np.nan)
+        deltas = counters.diff().iloc[1:]
+        # Until the benchmark pod exists the sampler reads the whole kubepods
+        # group, and counters restart whenever it moves to another cgroup.
+        # Only keep cgroup figures of the pod's own cgroup.
+        own_cgroup = counters['cgroup_pod'] == 1
+        counters['cgroup_memory'] = counters['cgroup_memory'].where(own_cgroup)
+        same_cgroup = (own_cgroup & (counters['cgroup_id'].diff() == 0)).iloc[1:]
+        for column in ('cgroup_cpu_usec', 'cgroup_read', 'cgroup_write'):
+            deltas[column] = deltas[column].where(same_cgroup)
+        seconds = deltas['time']
+        cpu_total = deltas['cpu_total'].where(deltas['cpu_total'] > 0)
+        frames.append(
+            pd.DataFrame({
+                'node': records[0][0],
+                'time': pd.to_datetime(counters['time'].iloc[1:], unit='s'),
+                'cpu': (deltas['cpu_busy'] / cpu_total).astype('float32'),
+                'iowait': (deltas['cpu_iowait'] / cpu_total).astype('float32'),
+                'memory': (counters['memory_used'].iloc[1:] / 1_000_000).astype('float32'),
+                'disk_read': (deltas['disk_read'] / seconds / 1_000_000).astype('float32'),
+                'disk_write': (deltas['disk_write'] / seconds / 1_000_000).astype('float32'),
+                'disk_busy': (deltas['disk_busy_ms'] / 1000 / seconds).astype('float32'),
+                'net_rx': (deltas['net_rx'] / seconds / 1_000_000).astype('float32'),
+                'net_tx': (deltas['net_tx'] / seconds / 1_000_000).astype('float32'),
+                'cgroup_cpu': (deltas['cgroup_cpu_usec'] / 1_000_000 / seconds).astype('float32'),
+                'cgroup_memory': (counters['cgroup_memory'].iloc[1:] / 1_000_000).astype('float32'),
+                'cgroup_read': (deltas['cgroup_read'] / seconds / 1_000_000).astype('float32'),
+                'cgroup_write': (deltas['cgroup_write'] / seconds / 1_000_000).astype('float32'),
+            }),
+        )
+    if not frames:
+        return pd.DataFrame()
+
+    samples = pd.concat(frames, ignore_index=True)
+    samples['node'] = samples['node'].astype('category')
+    samples['io_bound'] = (
+        (samples['iowait'] >= IOWAIT_THRESHOLD)
+        | (samples['disk_busy'] >= DISK_BUSY_THRESHOLD)
+    )
+    return samples.sort_values('time', ignore_index=True)
+
+
+def pull_samples(samples: pd.DataFrame, run_table: pd.DataFrame) -> pd.DataFrame:
+    """
+    Attach each sample taken while a run was pulling to that run.
+
+    Samples are matched to the latest pull starting before them, on the same
+    node where the run table has one, and kept if they fall before its end.
+    Sample times are epoch based, so both sides are compared in naive UTC.
+    The `pull_second` column is the sample time relative to the start of
+    the pull.
+    """
+    by = 'node' if 'node' in run_table else None
+    pulls = pd.DataFrame({
+        'run': run_table.index,
+        'pull_start': naive_utc(run_table['pull_start']),
+        'pull_end': naive_utc(run_table['pull_end']),
+    })
+    samples = samples.assign(time=naive_utc(samples['time']))
+    if by is not None:
+        pulls['node'] = run_table['node'].astype(str).to_numpy()
+        samples['node'] = samples['node'].astype(str)
+    else:
+        samples = samples.drop(columns='node')
+    matched = pd.merge_asof(
+        samples,
+        pulls.dropna(subset=['pull_start']).sort_values('pull_start'),
+        left_on='time',
+        right_on='pull_start',
+        by=by,
+    )
+    matched = matched[matched['time'] <= matched['pull_end']].copy()
+    matched['run'] = matched['run'].astype('int64')
+    matched['pull_second'] = (
+        matched['time'] - matched['pull_start']
+    ).dt.total_seconds().astype('float32')
+    return matched.drop(columns=['pull_start', 'pull_end'])
+
+
+def pull_throughput(matched: pd.DataFrame) -> pd.DataFrame:
+    """Per run mean throughput during the pull and the share of I/O bound samples."""
+    return matched.groupby('run').agg(
+        pull_net_rx=('net_rx', 'mean'),
+        pull_disk_write=('disk_write', 'mean'),
+        pull_cpu=('cpu', 'mean'),
+        pull_io_bound=('io_bound', 'mean'),
+    )
+
+
+def plot_pull_throughput(
+        matched: pd.DataFrame,
+        run_table: pd.DataFrame,
+        image: str,
+        plot_dir: pathlib.Path,
+) -> pathlib.Path:
+    fig, axs = plt.subplots(
+        nrows=2,
+        ncols=1,
+        figsize=(10, 10),
+        sharex=True,
+    )
+    image_runs = run_table[run_table['image'].astype(str).str.contains(image, regex=False)]
+    snapshotters = list(image_runs['snapshotter'].unique())
+    colors = plt.rcParams['axes.prop_cycle'].by_key()['color']
+    for run, run_samples in matched[matched['run'].isin(image_runs.index)].groupby('run'):
+        snapshotter = image_runs.loc[run, 'snapshotter']
+        color = colors[snapshotters.index(snapshotter) % len(colors)]
+        for ax, column in zip(axs, ('net_rx', 'disk_write')):
+            ax.plot(
+                run_samples['pull_second'],
+                run_samples[column],
+                color=color,
+                alpha=0.5,
+            )
+            io_bound = run_samples[run_samples['io_bound']]
+            ax.scatter(
+                io_bound['pull_second'],
+                io_bound[column],
+                color=color,
+                marker='x',
+            )
+
+    axs[0].set_ylabel('Network received [MB/s]')
+    axs[1].set_ylabel('Disk written [MB/s]')
+    fig.legend(
+        handles=[
+            plt.Line2D([], [], color=colors[i % len(colors)], label=snapshotter)
+            for i, snapshotter in enumerate(snapshotters)
+        ] + [plt.Line2D([], [], color='black', marker='x', linestyle='', label='I/O bound')],
+        loc='upper center',
+        ncol=len(snapshotters) + 1,
+    )
+    image_name = image.split('/')[-1]
+    fig.suptitle(f'{image_name}\nthroughput during pull\n')
+    fig.supxlabel('Time since pull start [s]')
+    plot_path = plot_dir / f'{image_name}-throughput.png'
+    fig.savefig(plot_path)
+    plt.close(fig)
+    return plot_path
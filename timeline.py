@@ -0,0 +1,309 @@
+from __future__ import annotations
+
+import argparse
+import datetime
+import json
+import pathlib
+import re
+from typing import Iterable
+from typing import Iterator
+
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from parse_logs import get_event_timestamp
+from parse_logs import parse_timestamp
+from plot import build_run_table
+from plot import combine_run_tables
+from plot import parse_results
+from plot import result_node
+
+# Columns of an event frame which hold a small set of repeated labels.
+EVENT_LABEL_COLUMNS = [
+    'node',
+    'source',
+    'kind',
+    'pod',
+]
+
+EVENT_CHUNK_SIZE = 1_000_000
+
+LANGE_NEW_POD_REGEX = re.compile(r'^New pod added: (?P<pod>\S+)')
+LANGE_SCHEDULED_REGEX = re.compile(
+    r'^Pod scheduled on (?P<node>\S+) (?P<nano>\d+) '
+    r'lastTransition: (?P<transition>\S+ \S+) (?P<offset>[+-]\d{4})',
+)
+LANGE_START_REGEX = re.compile(r'^(?P<nano>\d+) official start time:')
+
+# The CVMFS debug log appends '[MM-DD-YYYY HH:MM:SS UTC]' to every message.
+CVMFS_REGEX = re.compile(
+    r'^\((?P<module>[^)]+)\).*\[(?P<time>\d\d-\d\d-\d{4} \d\d:\d\d:\d\d) UTC\]\s*$',
+)
+
+
+def from_unix_nano(nano: str) -> datetime.datetime:
+    return datetime.datetime(1970, 1, 1) + datetime.timedelta(microseconds=int(nano) // 1000)
+
+
+def read_lange_log(path: pathlib.Path | str) -> Iterator[tuple]:
+    """
+    Yield (node, time, source, kind, pod) events from `lange/main.go` output.
+
+    'scheduled' and 'started' use the watcher's UnixNano clock, 'transition'
+    the API server's lastTransition time.
+    """
+    pod = ''
+    node = ''
+    with open(path) as file:
+        for line in file:
+            match = LANGE_NEW_POD_REGEX.match(line)
+            if match is not None:
+                pod = match['pod']
+                continue
+
+            match = LANGE_SCHEDULED_REGEX.match(line)
+            if match is not None:
+                node = match['node']
+                yield node, from_unix_nano(match['nano']), 'lange', 'scheduled', pod
+                transition = datetime.datetime.strptime(
+                    match['transition'] + match['offset'],
+                    '%Y-%m-%d %H:%M:%S%z',
+                )
+                transition = transition.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+                yield node, transition, 'lange', 'transition', pod
+                continue
+
+            match = LANGE_START_REGEX.match(line)
+            if match is not None:
+                yield node, from_unix_nano(match['nano']), 'lange', 'started', pod
+
+
+def read_kubernetes_events(path: pathlib.Path | str) -> Iterator[tuple]:
+    """Yield events from a `kubectl get events -o json` dump, as fetched by parse_logs.py."""
+    with open(path) as file:
+        events = json.load(file)
+    for event in events['items']:
+        timestamp = get_event_timestamp(event)
+        if not timestamp:
+            continue
+        node = (event.get('source') or {}).get('host') or event.get('reportingInstance') or ''
+        yield (
+            node,
+            parse_timestamp(timestamp),
+            'kubernetes',
+            event['reason'],
+            event['involvedObject'].get('name', ''),
+        )
+
+
+def read_cvmfs_log(path: pathlib.Path | str, node: str) -> Iterator[tuple]:
+    """Yield one event per CVMFS debug log line, with the module as its kind."""
+    with open(path, errors='replace') as file:
+        for line in file:
+            match = CVMFS_REGEX.match(line)
+            if match is None:
+                continue
+            yield (
+                node,
+                datetime.datetime.strptime(match['time'], '%m-%d-%Y %H:%M:%S'),
+                'cvmfs',
+                match['module'],
+                '',
+            )
+
+
+def events_frame(
+        events: Iterable[tuple],
+        chunk_size: int = EVENT_CHUNK_SIZE,
+) -> pd.DataFrame:
+    """
+    Collect events into one frame sorted by node and time.
+
+    Events are converted chunk by chunk so that label columns are only ever
+    held as Python strings for `chunk_size` events at a time.
+    """
+    columns = ['node', 'time', 'source', 'kind', 'pod']
+    chunks = []
+    chunk = []
+    for event in events:
+        chunk.append(event)
+        if len(chunk) >= chunk_size:
+            chunks.append(_events_chunk(chunk, columns))
+            chunk = []
+    chunks.append(_events_chunk(chunk, columns))
+
+    frame = pd.DataFrame({
+        'time': pd.concat([chunk['time'] for chunk in chunks], ignore_index=True),
+    })
+    for column in EVENT_LABEL_COLUMNS:
+        frame[column] = union_categoricals(
+            [chunk[column] for chunk in chunks],
+        )
+    return frame[columns].sort_values(['node', 'time'], ignore_index=True)
+
+
+def _events_chunk(chunk: list[tuple], columns: list[str]) -> pd.DataFrame:
+    frame = pd.DataFrame.from_records(chunk, columns=columns)
+    frame['time'] = frame['time'].astype('datetime64[ns]')
+    for column in EVENT_LABEL_COLUMNS:
+        frame[column] = frame[column].astype(str).astype('category')
+    return frame
+
+
+def read_runs(result_paths: Iterable[pathlib.Path]) -> pd.DataFrame:
+    """
+    Read `plot.py` result files into run intervals.
+
+    The node is the `$(hostname)` part of the result file name.
+    """
+    run_tables = []
+    for path in result_paths:
+        node = result_node(path)
+        benchmarks = [
+            {**benchmark, 'node': node}
+            for benchmark in parse_results(path)
+        ]
+        if benchmarks:
+            run_tables.append(build_run_table(benchmarks))
+    runs = combine_run_tables(run_tables)
+    runs['start'] = runs['benchmark_start'].astype('datetime64[ns]')
+    runs['end'] = runs['benchmark_end'].astype('datetime64[ns]')
+    return runs.reset_index(names='run')
+
+
+def join_events(
+        events: pd.DataFrame,
+        runs: pd.DataFrame,
+        tolerance: datetime.timedelta = datetime.timedelta(seconds=1),
+        source_tolerance: dict[str, datetime.timedelta] | None = None,
+        source_offset: dict[str, datetime.timedelta] | None = None,
+) -> pd.DataFrame:
+    """
+    Assign every event to the run on the same node whose window contains it.
+
+    This is a sorted merge, not a nested loop: each event is matched to the
+    latest run starting before it with `merge_asof` and then kept if it falls
+    before that run's end. Clocks are reconciled per source by first adding
+    `source_offset` to the event times, then widening run windows by
+    `source_tolerance` (default `tolerance`) on both sides. Where runs on one
+    node overlap, an event goes to the most recently started run.
+    """
+    source_tolerance = source_tolerance or {}
+    source_offset = source_offset or {}
+    # Join on integer node codes shared by both sides rather than strings.
+    nodes = pd.Index(runs['node'].astype(str).unique()).union(
+        events['node'].astype(str).unique(),
+    )
+    intervals = runs[['run', 'node', 'start', 'end']].sort_values('start')
+    intervals = intervals.assign(
+        node_code=pd.Categorical(intervals['node'], categories=nodes).codes,
+    ).drop(columns='node')
+
+    joined = []
+    for source, source_events in events.groupby('source', observed=True, sort=False):
+        source_events = source_events.assign(
+            node_code=pd.Categorical(source_events['node'], categories=nodes).codes,
+            time=source_events['time'] + source_offset.get(source, datetime.timedelta()),
+        )
+        skew = pd.Timedelta(source_tolerance.get(source, tolerance))
+        source_events['_key'] = source_events['time'] + skew
+        matched = pd.merge_asof(
+            source_events.sort_values('_key'),
+            intervals,
+            left_on='_key',
+            right_on='start',
+            by='node_code',
+        )
+        matched = matched[matched['time'] <= matched['end'] + skew]
+        joined.append(matched.drop(columns=['_key', 'node_code', 'start', 'end']))
+
+    if not joined:
+        return events.iloc[:0].assign(run=pd.Series(dtype='int64'))
+
+    joined = pd.concat(joined, ignore_index=True)
+    joined['run'] = joined['run'].astype('int64')
+    for column in EVENT_LABEL_COLUMNS:
+        joined[column] = joined[column].astype('category')
+    return joined
+
+
+def build_timeline(joined: pd.DataFrame, runs: pd.DataFrame) -> pd.DataFrame:
+    """
+    Flatten joined events into one record per run.
+
+    Every (source, kind) pair contributes its first and last time and event
+    count as `<source>_<kind>_first`, `_last` and `_count` columns.
+    """
+    grouped = joined.groupby(['run', 'source', 'kind'], observed=True)['time'].agg(
+        first='min',
+        last='max',
+        count='count',
+    )
+    wide = grouped.unstack(['source', 'kind'])
+    wide.columns = [
+        f'{source}_{kind}_{statistic}'
+        for statistic, source, kind in wide.columns
+    ]
+    wide = wide[sorted(wide.columns)]
+    return runs.merge(wide, left_on='run', right_index=True, how='left')
+
+
+def parse_source_seconds(values: list[str]) -> dict[str, datetime.timedelta]:
+    source_seconds = {}
+    for value in values:
+        source, _, seconds = value.partition('=')
+        source_seconds[source] = datetime.timedelta(seconds=float(seconds))
+    return source_seconds
+
+
+def parse_node_paths(values: list[str]) -> list[tuple[str, pathlib.Path]]:
+    node_paths = []
+    for value in values:
+        node, _, path = value.partition('=')
+        node_paths.append((node, pathlib.Path(path)))
+    return node_paths
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Merge benchmark logs into one timeline record per run.',
+    )
+    parser.add_argument('results', nargs='+', type=pathlib.Path, help='plot.py result files')
+    parser.add_argument('--lange', nargs='*', default=[], type=pathlib.Path, help='lange/main.go output')
+    parser.add_argument('--events', nargs='*', default=[], type=pathlib.Path, help='kubectl events JSON')
+    parser.add_argument('--cvmfs', nargs='*', default=[], help='NODE=PATH of CVMFS debug logs')
+    parser.add_argument('--tolerance', type=float, default=1.0, help='clock skew tolerance [s]')
+    parser.add_argument(
+        '--offset', nargs='*', default=[],
+        help='SOURCE=SECONDS added to the event times of a source',
+    )
+    parser.add_argument(
+        '--source-tolerance', nargs='*', default=[],
+        help='SOURCE=SECONDS clock skew tolerance of a source, overriding --tolerance',
+    )
+    parser.add_argument('--output', type=pathlib.Path, default=pathlib.Path('timeline.csv'))
+    args = parser.parse_args()
+
+    def all_events() -> Iterator[tuple]:
+        for path in args.lange:
+            yield from read_lange_log(path)
+        for path in args.events:
+            yield from read_kubernetes_events(path)
+        for node, path in parse_node_paths(args.cvmfs):
+            yield from read_cvmfs_log(path, node)
+
+    runs = read_runs(args.results)
+    events = events_frame(all_events())
+    print(f'Read {len(runs)} runs and {len(events)} events')
+
+    joined = join_events(
+        events,
+        runs,
+        tolerance=datetime.timedelta(seconds=args.tolerance),
+        source_tolerance=parse_source_seconds(args.source_tolerance),
+        source_offset=parse_source_seconds(args.offset),
+    )
+    print(f'Joined {len(joined)} events to runs')
+
+    build_timeline(joined, runs).to_csv(args.output, index=False)
+    print(f'Saved timeline: {args.output}')
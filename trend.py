@@ -0,0 +1,413 @@
+from __future__ import annotations
+
+import pathlib
+import re
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from tabulate import tabulate
+
+from analysis.utils import paths
+from plot import DATETIME_REGEX
+from plot import build_run_table
+from plot import load_yaml
+from plot import parse_results
+from plot import remove_snapshotter_name
+from plot import result_node
+from plot import string_to_datetime
+
+TIME_COLUMNS = [
+    'pull_time',
+    'creation_time',
+    'execution_time',
+    'total_time',
+]
+
+# One trend series is one measurement setup followed across campaigns.
+SERIES_COLUMNS = [
+    'node',
+    'repository',
+    'script',
+    'snapshotter',
+]
+
+INDEX_COLUMNS = [
+    'campaign',
+    'campaign_size',
+    'campaign_date',
+    'node',
+    'repository',
+    'image_tag',
+    'script',
+    'snapshotter',
+    'snapshotter_version',
+    'runs',
+] + [
+    f'{column}{suffix}'
+    for column in TIME_COLUMNS
+    for suffix in ('', '_std')
+]
+
+# A split is a change point when its p-value, calibrated by simulating
+# series without a change, is below this.
+CHANGE_ALPHA = 0.01
+SIMULATIONS = 999
+MIN_SEGMENT_SIZE = 2
+
+
+def campaign_aggregates(result_file: pathlib.Path) -> pd.DataFrame | None:
+    """
+    Aggregate one result file, which is one campaign, into per-setup rows.
+
+    Returns None for files without a complete benchmark, such as campaigns
+    which are still running.
+    """
+    node = result_node(result_file)
+    benchmarks = [
+        {'snapshotter_version': 'unknown', **benchmark, 'node': node}
+        for benchmark in parse_results(result_file)
+    ]
+    if not benchmarks:
+        print(f'Skipping: {result_file.name} has no complete benchmarks')
+        return None
+    run_table = build_run_table(benchmarks)
+    image = run_table['image'].astype(str).map(remove_snapshotter_name)
+    run_table['repository'] = image.str.rsplit(':', n=1).str[0]
+    run_table['image_tag'] = image.str.rsplit(':', n=1).str[-1]
+
+    aggregates = run_table.groupby(
+        ['node', 'repository', 'image_tag', 'script', 'snapshotter', 'snapshotter_version'],
+        observed=True,
+    ).agg(
+        runs=('pull_time', 'count'),
+        **{
+            f'{column}{suffix}': (column, statistic)
+            for column in TIME_COLUMNS
+            for suffix, statistic in (('', 'mean'), ('_std', 'std'))
+        },
+    ).reset_index()
+    aggregates['campaign'] = result_file.name
+    aggregates['campaign_size'] = result_file.stat().st_size
+    aggregates['campaign_date'] = string_to_datetime(
+        re.search(DATETIME_REGEX, result_file.name).group(),
+    )
+    return aggregates[INDEX_COLUMNS]
+
+
+def update_index(
+        result_paths: list[pathlib.Path],
+        index_path: pathlib.Path,
+) -> pd.DataFrame:
+    """
+    Bring the campaign index up to date with `result_paths`.
+
+    Only campaigns which are not in the index yet, or whose result file has
+    changed size since, are parsed. Everything else is read from the index.
+    Campaigns whose result file is gone or filtered out are dropped.
+    """
+    if index_path.exists():
+        index = pd.read_csv(
+            index_path,
+            parse_dates=['campaign_date'],
+            dtype={'image_tag': str, 'snapshotter_version': str},
+        )
+    else:
+        index = pd.DataFrame(columns=INDEX_COLUMNS)
+
+    indexed_sizes = dict(zip(index['campaign'], index['campaign_size']))
+    new_paths = [
+        path for path in result_paths
+        if indexed_sizes.get(path.name) != path.stat().st_size
+    ]
+    current_names = {path.name for path in result_paths}
+    stale = ~index['campaign'].isin(current_names)
+    if not new_paths and not stale.any():
+        return index
+
+    for path in new_paths:
+        print(f'Indexing: {path.name}')
+    new_campaigns = [
+        aggregates for aggregates in map(campaign_aggregates, new_paths)
+        if aggregates is not None
+    ]
+    kept = index[
+        ~stale & ~index['campaign'].isin([path.name for path in new_paths])
+    ]
+    frames = [frame for frame in [kept] + new_campaigns if not frame.empty]
+    index = (
+        pd.concat(frames, ignore_index=True)
+        if frames
+        else pd.DataFrame(columns=INDEX_COLUMNS)
+    ).sort_values(['campaign_date'] + SERIES_COLUMNS, ignore_index=True)
+    index.to_csv(index_path, index=False)
+    return index
+
+
+def split_scores(
+        means: np.ndarray,
+        stds: np.ndarray,
+        runs: np.ndarray,
+        min_size: int,
+) -> np.ndarray:
+    """
+    Welch t statistic for every split of the campaigns, for each row.
+
+    All arguments are (series, campaigns) arrays. The run-level mean
+    and variance of either side are rebuilt from the per-campaign `runs`,
+    means and standard deviations, so campaigns with more runs weigh more.
+    Column j of the result is the split before campaign `min_size + j`.
+    """
+    sums = runs * means
+    squares = np.nan_to_num((runs - 1) * stds ** 2) + runs * means ** 2
+    left_runs = np.cumsum(runs, axis=1)[:, :-1]
+    left_sums = np.cumsum(sums, axis=1)[:, :-1]
+    left_squares = np.cumsum(squares, axis=1)[:, :-1]
+    right_runs = runs.sum(axis=1, keepdims=True) - left_runs
+    right_sums = sums.sum(axis=1, keepdims=True) - left_sums
+    right_squares = squares.sum(axis=1, keepdims=True) - left_squares
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        left_mean = left_sums / left_runs
+        right_mean = right_sums / right_runs
+        left_variance = (left_squares - left_runs * left_mean ** 2) / (left_runs - 1)
+        right_variance = (right_squares - right_runs * right_mean ** 2) / (right_runs - 1)
+        error = np.sqrt(
+            np.clip(left_variance, 0, None) / left_runs
+            + np.clip(right_variance, 0, None) / right_runs,
+        )
+        difference = np.abs(right_mean - left_mean)
+        scores = np.where(error > 0, difference / error, np.where(difference > 0, np.inf, 0))
+    scores = np.nan_to_num(scores, nan=0.0)
+    return scores[:, min_size - 1:means.shape[1] - min_size]
+
+
+def detect_change_points(
+        means: np.ndarray,
+        stds: np.ndarray,
+        runs: np.ndarray,
+        alpha: float = CHANGE_ALPHA,
+        min_size: int = MIN_SEGMENT_SIZE,
+        simulations: int = SIMULATIONS,
+        seed: int = 0,
+) -> list[int]:
+    """
+    Find shifts in the mean of a per-campaign series by binary segmentation.
+
+    Each segment is split where the Welch t statistic between its left and
+    right campaigns is largest. Taking the largest of many splits inflates
+    the statistic, so its p-value comes from the largest statistic of
+    `simulations` segments without a change: campaign means drawn around
+    the segment mean with their own standard error plus the spread
+    between campaigns beyond it (the DerSimonian-Laird estimate). The
+    split is kept if that p-value is below `alpha`. Returns the sorted
+    indices of the first campaign after each change.
+    """
+    means = np.asarray(means, dtype='float64')
+    stds = np.asarray(stds, dtype='float64')
+    runs = np.asarray(runs, dtype='float64')
+    # Campaigns with a single run have no standard deviation.
+    if np.isnan(stds).all():
+        stds = np.full_like(means, np.std(means, ddof=1) if len(means) > 1 else 0.0)
+    else:
+        stds = np.where(np.isnan(stds), np.nanmean(stds), stds)
+    rng = np.random.default_rng(seed)
+    change_points = []
+    segments = [(0, len(means))]
+    while segments:
+        start, end = segments.pop()
+        if end - start < 2 * min_size:
+            continue
+        segment = slice(start, end)
+        scores = split_scores(
+            means[None, segment],
+            stds[None, segment],
+            runs[None, segment],
+            min_size,
+        )[0]
+        best = int(np.argmax(scores))
+        if scores[best] == 0:
+            continue
+
+        variance = np.maximum(stds[segment] ** 2 / runs[segment], 1e-12)
+        weights = 1 / variance
+        mean = np.sum(weights * means[segment]) / np.sum(weights)
+        heterogeneity = np.sum(weights * (means[segment] - mean) ** 2)
+        between = max(
+            0.0,
+            (heterogeneity - (end - start - 1))
+            / (np.sum(weights) - np.sum(weights ** 2) / np.sum(weights)),
+        )
+        null_means = mean + rng.standard_normal((simulations, end - start)) * np.sqrt(
+            variance + between,
+        )
+        null_scores = split_scores(
+            null_means,
+            np.tile(stds[segment], (simulations, 1)),
+            np.tile(runs[segment], (simulations, 1)),
+            min_size,
+        ).max(axis=1)
+        p_value = (1 + np.sum(null_scores >= scores[best])) / (simulations + 1)
+        if p_value >= alpha:
+            continue
+
+        split = start + min_size + best
+        change_points.append(split)
+        segments.append((start, split))
+        segments.append((split, end))
+    return sorted(change_points)
+
+
+def find_changes(index: pd.DataFrame, **kwargs) -> pd.DataFrame:
+    """
+    Run change-point detection on every series and time column.
+
+    Each change is reported with the run-weighted means either side of it
+    and whether the image tag or snapshotter version changed at that
+    campaign.
+    """
+    changes = []
+    for series_key, series in index.groupby(SERIES_COLUMNS, sort=False):
+        series = series.sort_values('campaign_date', ignore_index=True)
+        runs = series['runs'].to_numpy(dtype='float64')
+        for column in TIME_COLUMNS:
+            values = series[column].to_numpy(dtype='float64')
+            change_points = detect_change_points(
+                values,
+                series[f'{column}_std'].to_numpy(dtype='float64'),
+                runs,
+                **kwargs,
+            )
+            bounds = [0] + change_points + [len(values)]
+            for i, change_point in enumerate(change_points):
+                before_slice = slice(bounds[i], change_point)
+                after_slice = slice(change_point, bounds[i + 2])
+                before = np.average(values[before_slice], weights=runs[before_slice])
+                after = np.average(values[after_slice], weights=runs[after_slice])
+                previous = series.loc[change_point - 1]
+                current = series.loc[change_point]
+                changes.append({
+                    **dict(zip(SERIES_COLUMNS, series_key)),
+                    'metric': column,
+                    'campaign': current['campaign'],
+                    'campaign_date': current['campaign_date'],
+                    'before': before,
+                    'after': after,
+                    'change_%': 100 * (after - before) / before,
+                    'regression': after > before,
+                    'image_tag_change': (
+                        f'{previous["image_tag"]} -> {current["image_tag"]}'
+                        if previous['image_tag'] != current['image_tag']
+                        else ''
+                    ),
+                    'snapshotter_version_change': (
+                        f'{previous["snapshotter_version"]} -> {current["snapshotter_version"]}'
+                        if previous['snapshotter_version'] != current['snapshotter_version']
+                        else ''
+                    ),
+                })
+    return pd.DataFrame(changes)
+
+
+def plot_trends(
+        index: pd.DataFrame,
+        changes: pd.DataFrame,
+        plot_dir: pathlib.Path,
+) -> list[pathlib.Path]:
+    plot_paths = []
+    metrics = TIME_COLUMNS[:3]
+    colors = plt.rcParams['axes.prop_cycle'].by_key()['color']
+    for (repository, script), image_index in index.groupby(['repository', 'script'], sort=False):
+        fig, axs = plt.subplots(
+            nrows=len(metrics),
+            ncols=1,
+            figsize=(10, 10),
+            sharex=True,
+        )
+        series_keys = list(image_index.groupby(['node', 'snapshotter'], sort=False).groups)
+        for series_index, (node, snapshotter) in enumerate(series_keys):
+            series = image_index[
+                (image_index['node'] == node)
+                & (image_index['snapshotter'] == snapshotter)
+            ].sort_values('campaign_date')
+            color = colors[series_index % len(colors)]
+            label = snapshotter if len(set(image_index['node'])) == 1 else f'{snapshotter} ({node})'
+            for ax, metric in zip(axs, metrics):
+                ax.errorbar(
+                    series['campaign_date'],
+                    series[metric],
+                    yerr=series[f'{metric}_std'],
+                    color=color,
+                    marker='o',
+                    capsize=3,
+                    label=label,
+                )
+                if changes.empty:
+                    continue
+                series_changes = changes[
+                    (changes['node'] == node)
+                    & (changes['repository'] == repository)
+                    & (changes['script'] == script)
+                    & (changes['snapshotter'] == snapshotter)
+                    & (changes['metric'] == metric)
+                ]
+                for change in series_changes.itertuples():
+                    ax.axvline(
+                        change.campaign_date,
+                        color=color,
+                        linestyle='--' if change.regression else ':',
+                    )
+
+        for ax, metric in zip(axs, metrics):
+            ax.set_ylabel(f'{metric.split("_")[0].capitalize()} time [s]')
+        axs[0].legend()
+        script_name = script.split('/')[-1].split('.')[0]
+        image_name = repository.split('/')[-1]
+        fig.suptitle(
+            f'{image_name} {script_name}\ndashed=regression, dotted=improvement\n',
+        )
+        fig.supxlabel('Campaign')
+        fig.autofmt_xdate()
+        plot_path = plot_dir / f'{image_name}-{script_name}-trend.png'
+        fig.savefig(plot_path)
+        plt.close(fig)
+        print(f'Saved plot: {plot_path.name}')
+        plot_paths.append(plot_path)
+    return plot_paths
+
+
+if __name__ == '__main__':
+    CONFIG = load_yaml(paths.CONFIG_FILE)
+    filename_filter = CONFIG['regex-filters'].get('filename') or '.*'
+    trend_config = CONFIG.get('trend') or {}
+
+    results_directory_path = paths.PROJECT_ROOT / CONFIG['results_directory']
+    # Unlike plot.py, every campaign is used, not only the latest ones.
+    result_paths = sorted(
+        path for path in results_directory_path.iterdir()
+        if re.search(DATETIME_REGEX, path.name) is not None
+        and re.search(filename_filter, str(path)) is not None
+    )
+
+    index = update_index(result_paths, paths.OUTPUT_DIR / 'trend_index.csv')
+    changes = find_changes(
+        index,
+        alpha=trend_config.get('alpha', CHANGE_ALPHA),
+        min_size=trend_config.get('min_size', MIN_SEGMENT_SIZE),
+        simulations=trend_config.get('simulations', SIMULATIONS),
+    )
+    changes_file = paths.OUTPUT_DIR / 'trend_changes.csv'
+    changes.to_csv(changes_file, index=False)
+
+    if changes.empty:
+        print('\nNo change points found')
+    else:
+        print(tabulate(changes[changes['regression']], headers='keys', showindex=False))
+
+    plot_trends(index, changes, paths.PLOT_DIR)
+
+    print(
+        f'\nTREND COMPLETE'
+        f'\n\nPlots saved to:\n{paths.PLOT_DIR}'
+        f'\n\nChange points saved to:\n{changes_file}',
+    )